@@ -67,11 +67,9 @@ class VarphiToPythonDAPCompiler(VarphiCompiler):
         if self._initial_state is None:
             self._initial_state = t.current_state
 
-        read_str = "(" + ", ".join(f"'{s}'" for s in t.read_symbols)
-        read_str += ",)" if len(t.read_symbols) == 1 else ")"
-
-        write_str = "(" + ", ".join(f"'{s}'" for s in t.write_symbols)
-        write_str += ",)" if len(t.write_symbols) == 1 else ")"
+        # repr() of a tuple already renders 1-tuples as ('a',)
+        read_str = repr(tuple(t.read_symbols))
+        write_str = repr(tuple(t.write_symbols))
 
         code = (
             f"{t.current_state}.add_instruction(\n"
@@ -1,56 +1,129 @@
 from __future__ import annotations
 import sys
 import json
+import atexit
 import threading
 import queue
 import os
 import io
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional
 from varphi_python.lib import TuringMachine, State, Tape
 from varphi_devkit import BLANK
 
+try:
+    # Use the C-accelerated orjson codec when it is installed
+    from orjson import dumps as _json_dumps, loads as _json_loads
+except ImportError:
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
 
-class DAPStdout(io.TextIOBase):
-    """Redirects stdout to the VS Code Debug Console (Output category)."""
-    server: DAPServer
-    buffer: io.StringIO
+    _json_loads = json.loads
 
-    def __init__(self, server_instance):
-        self.server = server_instance
-        self.buffer = io.StringIO()
+# Framing header prepended to every outgoing DAP message
+HEADER_FMT = b"Content-Length: %d\r\n\r\n"
+# Fixed fields of every DAP response; the command, body and message are spliced in
+RESPONSE_FMT = b'{"type":"response","request_seq":%d,"command":%b,"success":%b%b,"seq":%d}'
 
-    def write(self, s: str):
-        if self.server:
-            self.server._send_event("output", {"category": "stdout", "output": s})
-        return len(s)
 
+class _DAPOutputStream(io.TextIOBase):
+    """
+    Line-buffered stream that forwards text to the VS Code Debug Console.
 
-class DAPStderr(io.TextIOBase):
-    """Redirects stderr to the VS Code Debug Console (Stderr category, usually red)."""
+    Writes accumulate in ``buffer`` and are sent as a single DAP ``output`` event
+    whenever a newline is written or the stream is flushed explicitly. Until the
+    client has finished configuring the session, output is only accumulated.
+    """
+    category: str
     server: DAPServer
-    buffer: io.StringIO
+    buffer: bytearray
 
     def __init__(self, server_instance):
         self.server = server_instance
-        self.buffer = io.StringIO()
+        self.buffer = bytearray()
 
     def write(self, s: str):
-        if self.server:
-            self.server._send_event("output", {"category": "stderr", "output": s})
+        if not s:
+            return 0
+        self.buffer += s.encode("utf-8")
+        if self.server and self.server._output_enabled:
+            end = self.buffer.rfind(b"\n")
+            if end >= 0:
+                self._emit(end + 1)
         return len(s)
 
+    def flush(self):
+        if self.buffer:
+            self._emit(len(self.buffer))
+
+    def _emit(self, end: int):
+        output = self.buffer[:end].decode("utf-8")
+        del self.buffer[:end]
+        if self.server:
+            self.server._send_event("output", {"category": self.category, "output": output})
+
+
+class DAPStdout(_DAPOutputStream):
+    """Redirects stdout to the VS Code Debug Console (Output category)."""
+    category = "stdout"
+
+
+class DAPStderr(_DAPOutputStream):
+    """Redirects stderr to the VS Code Debug Console (Stderr category, usually red)."""
+    category = "stderr"
+
 
 class DAPServer:
     tm: TuringMachine
-    breakpoints: dict[int, bool]
+    breakpoints: frozenset[int]
     running: bool
     step_granularity: Optional[str]
     steps_count: int
-    input_queue: queue.Queue
+    input_queue: queue.SimpleQueue
     original_source_path: str
+    _source_dict: Dict[str, Any]
+
+    # Steps executed between polls of the request queue while continuing
+    FAST_FORWARD_STEPS = 10_000
+
+    # Cell offsets shown either side of the head in the tape visualization
+    _LEFT_OFFSETS = tuple(range(-5, 0))
+    _RIGHT_OFFSETS = tuple(range(1, 6))
+
+    # Response bodies that never change between requests, encoded up front
+    _INIT_BODY = _json_dumps({
+        "supportsConfigurationDoneRequest": True,
+        "supportsSetVariable": False,
+        "supportsValueFormattingOptions": False,
+        "supportsExceptionInfoRequest": True,
+    })
+    _THREADS_BODY = _json_dumps({"threads": [{"id": 1, "name": "Main Thread"}]})
+    # Unified scope "Machine State"
+    _SCOPES_BODY = _json_dumps({
+        "scopes": [
+            {
+                "name": "Machine State",
+                "variablesReference": 1,
+                "expensive": False,
+            }
+        ]
+    })
+    _EXCEPTION_INFO_BODY = _json_dumps({
+        "exceptionId": "runtime_error",
+        "description": "An error occurred during execution",
+        "breakMode": "always",
+    })
 
     _seq: int = 0
     _write_lock: threading.Lock
+    _out_fd: int
+    _handlers: Dict[str, Callable[[Dict[str, Any]], None]]
+    _command_json: Dict[str, bytes]
+    _output_enabled: bool
+    _space_cache: Optional[List[int]]
+    _stack_trace_key: Optional[tuple[str, int]]
+    _stack_trace_body: Optional[bytes]
+    _variables_key: Optional[tuple[str, int]]
+    _variables_body: Optional[bytes]
 
     def __init__(
         self,
@@ -60,21 +133,47 @@ class DAPServer:
         original_source_path: str,
     ):
         self.original_source_path = os.path.abspath(original_source_path)
+        # Source reference reported with every stack frame; it never changes
+        self._source_dict = {
+            "name": os.path.basename(self.original_source_path),
+            "path": self.original_source_path,
+            "sourceReference": 0,
+        }
         self._write_lock = threading.Lock()
 
+        # We write to __stdout__ because sys.stdout is redirected. Anything already
+        # buffered there is drained once; from here on frames go to the descriptor.
+        sys.__stdout__.flush()
+        self._out_fd = sys.__stdout__.fileno()
+
+        # Resolve the "handle_<command>" methods once so dispatch is a dict lookup
+        self._handlers = {
+            name[len("handle_"):]: getattr(self, name)
+            for name in dir(type(self))
+            if name.startswith("handle_")
+        }
+        self._command_json = {cmd: _json_dumps(cmd) for cmd in self._handlers}
+
         tapes = tuple(Tape(t) for t in input_tapes)
         self.tm = TuringMachine(k, tapes, initial_state)
 
-        self.breakpoints = {}
+        self.breakpoints = frozenset()
         self.running = False
         self.step_granularity = "instruction"
         self.steps_count = 0
+        self._space_cache = None
+        self._stack_trace_key = self._stack_trace_body = None
+        self._variables_key = self._variables_body = None
+
+        self.input_queue = queue.SimpleQueue()
 
-        self.input_queue = queue.Queue()
+        # Console output is held back until configurationDone
+        self._output_enabled = False
 
         # Redirect stdout and stderr to DAP console
         sys.stdout = DAPStdout(self)
         sys.stderr = DAPStderr(self)
+        atexit.register(self._flush_output)
 
         self.reader_thread = threading.Thread(target=self._read_input_loop, daemon=True)
         self.reader_thread.start()
@@ -91,53 +190,121 @@ class DAPServer:
         with self._write_lock:
             self._seq += 1
             msg["seq"] = self._seq
-            json_msg = json.dumps(msg)
-            encoded = json_msg.encode("utf-8")
-            # We write to __stdout__ because sys.stdout is redirected
-            sys.__stdout__.buffer.write(
-                f"Content-Length: {len(encoded)}\r\n\r\n".encode("utf-8")
-            )
-            sys.__stdout__.buffer.write(encoded)
-            sys.__stdout__.buffer.flush()
+            self._write_frame(_json_dumps(msg))
+
+    def _write_frame(self, encoded: bytes):
+        """Writes one encoded message with its header. The caller must hold _write_lock."""
+        # Header and body go straight to the real stdout descriptor in a single write,
+        # bypassing the TextIOWrapper/BufferedWriter layers of sys.__stdout__.
+        frame = memoryview(HEADER_FMT % len(encoded) + encoded)
+        while frame:
+            frame = frame[os.write(self._out_fd, frame):]
+
+    def _flush_output(self):
+        """Drains any partial lines still buffered in the redirected streams."""
+        sys.stdout.flush()
+        sys.stderr.flush()
 
     def _read_input_loop(self):
         buffer = sys.stdin.buffer
+        received = bytearray()
         while True:
             try:
-                content_length = 0
-                while True:
-                    line = buffer.readline()
-                    if not line:
-                        return
+                chunk = buffer.read1(4096)
+                if not chunk:
+                    return
+                received += chunk
 
-                    line_str = line.decode("utf-8").strip()
-                    if not line_str:
+                # Extract every complete message currently buffered
+                while True:
+                    header_end = received.find(b"\r\n\r\n")
+                    if header_end < 0:
                         break
 
-                    if line_str.startswith("Content-Length:"):
-                        content_length = int(line_str.split(":", 1)[1].strip())
+                    content_length = 0
+                    marker = received.find(b"Content-Length:", 0, header_end)
+                    if marker >= 0:
+                        value_end = received.find(b"\r\n", marker, header_end)
+                        if value_end < 0:
+                            value_end = header_end
+                        content_length = int(received[marker + 15 : value_end])
+
+                    body_start = header_end + 4
+                    body_end = body_start + content_length
+                    if len(received) < body_end:
+                        break
 
-                if content_length > 0:
-                    content = buffer.read(content_length)
-                    self.input_queue.put(json.loads(content))
+                    content = bytes(received[body_start:body_end])
+                    del received[:body_end]
+                    if content_length > 0:
+                        self.input_queue.put(_json_loads(content))
             except Exception:
                 break
 
     def run_event_loop(self):
         while True:
-            try:
-                timeout = 0.0 if self.running else None
-                req = self.input_queue.get(timeout=timeout)
-                self._handle_request(req)
-            except queue.Empty:
-                pass
+            if self.running:
+                # Only pick up a request if one is already waiting
+                try:
+                    req = self.input_queue.get_nowait()
+                except queue.Empty:
+                    pass
+                else:
+                    self._handle_request(req)
+            else:
+                self._handle_request(self.input_queue.get())
 
             if self.running:
-                self._step_machine()
+                if self.step_granularity == "step":
+                    self._step_machine()
+                else:
+                    self._run_until_stop(self.FAST_FORWARD_STEPS)
+
+    def _run_until_stop(self, max_steps: int):
+        """
+        Runs up to max_steps steps of a "continue" without servicing requests in between.
+        Halts and breakpoints are left to _step_machine to report.
+        """
+        # Bind everything the loop touches to locals
+        tm = self.tm
+        step = tm.step
+        peek = tm.peek
+        bps = self.breakpoints
+
+        steps = 0
+        try:
+            while steps < max_steps:
+                instr = tm._next_instruction
+                if instr is None or (bps and instr.line_number in bps):
+                    break
+                step()
+                steps += 1
+                peek()
+            else:
+                return
+        except Exception as e:
+            self._stop_on_exception(e)
+            return
+        finally:
+            if steps:
+                self.steps_count += steps
+                self._space_cache = None
+
+        self._step_machine()
+
+    def _view_key(self) -> tuple[str, int]:
+        """Identifies the machine position that stackTrace/variables responses describe."""
+        return (self.tm.state.name, self.steps_count)
+
+    def _total_space(self) -> int:
+        """Returns the cells used across all heads, recomputed only after the machine steps."""
+        if self._space_cache is None:
+            self._space_cache = [h.space_complexity() for h in self.tm.heads]
+        return sum(self._space_cache)
 
     def _print_halt_report(self):
         """Calculates statistics and prints the halt report to the Debug Console."""
-        total_space = sum(h.space_complexity() for h in self.tm.heads)
+        total_space = self._total_space()
         
         report = []
         report.append(f"HALTED at state '{self.tm.state.name}'")
@@ -146,34 +313,37 @@ class DAPServer:
         report.append(f"Number of tapes: {len(self.tm.heads)}")
 
         for i, tape in enumerate(self.tm.tapes):
-            # Extract tape content from min_index to max_index
-            tape_dict = tape._tape
-            if not tape_dict:
+            # Extract tape content between the bounds the tape already tracks,
+            # rather than scanning every key for the min/max index
+            if tape.is_empty:
                 content = ""
             else:
-                min_idx = min(tape_dict.keys())
-                max_idx = max(tape_dict.keys())
+                get = tape._tape.get
                 # Construct string, replacing missing spots with BLANK if necessary
-                content = "".join(tape_dict.get(k, BLANK) for k in range(min_idx, max_idx + 1))
+                content = "".join(
+                    [get(k, BLANK) for k in range(tape._min_idx, tape._max_idx + 1)]
+                )
             
             report.append(f"Tape {i + 1}: {content.strip("_")}")
 
-        # Join with newlines and print. This goes to DAPStdout -> VS Code Debug Console
-        print("\n" + "\n".join(report) + "\n")
+        # Join with newlines and write once, so DAPStdout sends the whole report
+        # to the VS Code Debug Console as a single output event
+        sys.stdout.write("\n" + "\n".join(report) + "\n\n")
 
     def _step_machine(self):
         # Check termination
         if self.tm._next_instruction is None:
             self.running = False
             self._print_halt_report()
+            self._flush_output()
             self._send_event("terminated")
             self._send_event("exited", {"exitCode": 0})
             return
 
         # Check breakpoints (unless single-stepping)
-        if self.step_granularity != "step":
-            current_line = self.tm._next_instruction.line_number
-            if self.breakpoints.get(current_line, False):
+        bps = self.breakpoints
+        if bps and self.step_granularity != "step":
+            if self.tm._next_instruction.line_number in bps:
                 self.running = False
                 self._send_event(
                     "stopped",
@@ -184,19 +354,11 @@ class DAPServer:
         # Execute Step (with Error Handling)
         try:
             self.tm.step()
+            self._space_cache = None
             self.steps_count += 1
             has_next = self.tm.peek()
         except Exception as e:
-            self.running = False
-            # Print error to Debug Console (red)
-            sys.stderr.write(f"\nRUNTIME ERROR: {str(e)}\n")
-            # Notify VS Code to pause on exception
-            self._send_event("stopped", {
-                "reason": "exception",
-                "description": "Paused on exception",
-                "text": str(e),
-                "threadId": 1
-            })
+            self._stop_on_exception(e)
             return
 
         # Handle Step Pause
@@ -206,20 +368,47 @@ class DAPServer:
             reason = "step" if has_next else "pause"
             self._send_event("stopped", {"reason": reason, "threadId": 1})
 
+    def _stop_on_exception(self, e: Exception):
+        self.running = False
+        # Print error to Debug Console (red)
+        sys.stderr.write(f"\nRUNTIME ERROR: {str(e)}\n")
+        # Notify VS Code to pause on exception
+        self._send_event("stopped", {
+            "reason": "exception",
+            "description": "Paused on exception",
+            "text": str(e),
+            "threadId": 1
+        })
+
     def _send_response(
         self, req: Dict, success: bool, body: Any = None, message: str = None
     ):
-        resp = {
-            "type": "response",
-            "request_seq": req["seq"],
-            "command": req["command"],
-            "success": success,
-        }
+        """
+        Sends a response to req. body may be given pre-encoded as JSON bytes;
+        only the body and message go through the JSON encoder.
+        """
+        command = req["command"]
+        command_json = self._command_json.get(command) or _json_dumps(command)
+        extra = b""
         if body:
-            resp["body"] = body
+            if not isinstance(body, bytes):
+                body = _json_dumps(body)
+            extra += b',"body":' + body
         if message:
-            resp["message"] = message
-        self._send_message(resp)
+            extra += b',"message":' + _json_dumps(message)
+
+        with self._write_lock:
+            self._seq += 1
+            self._write_frame(
+                RESPONSE_FMT
+                % (
+                    req["seq"],
+                    command_json,
+                    b"true" if success else b"false",
+                    extra,
+                    self._seq,
+                )
+            )
 
     def _send_event(self, event: str, body: Any = None):
         msg = {"type": "event", "event": event}
@@ -231,7 +420,7 @@ class DAPServer:
         try:
             if req["type"] == "request":
                 cmd = req["command"]
-                handler = getattr(self, f"handle_{cmd}", None)
+                handler = self._handlers.get(cmd)
                 if handler:
                     handler(req)
                 else:
@@ -244,16 +433,7 @@ class DAPServer:
     # --- Handlers ---
 
     def handle_initialize(self, req):
-        self._send_response(
-            req,
-            True,
-            {
-                "supportsConfigurationDoneRequest": True,
-                "supportsSetVariable": False,
-                "supportsValueFormattingOptions": False,
-                "supportsExceptionInfoRequest": True,
-            },
-        )
+        self._send_response(req, True, self._INIT_BODY)
         self._send_event("initialized")
 
     def handle_launch(self, req):
@@ -261,18 +441,26 @@ class DAPServer:
 
     def handle_setBreakpoints(self, req):
         lines = req["arguments"].get("lines", [])
-        self.breakpoints = {ln: True for ln in lines}
+        self.breakpoints = frozenset(lines)
         verified_bps = [{"verified": True, "line": ln} for ln in lines]
         self._send_response(req, True, {"breakpoints": verified_bps})
 
     def handle_configurationDone(self, req):
         self._send_response(req, True)
         self._send_event("stopped", {"reason": "entry", "threadId": 1})
+        self._output_enabled = True
+        self._flush_output()
 
     def handle_threads(self, req):
-        self._send_response(req, True, {"threads": [{"id": 1, "name": "Main Thread"}]})
+        self._send_response(req, True, self._THREADS_BODY)
 
     def handle_stackTrace(self, req):
+        # Clients re-request the stack at every stop; reuse it until the machine moves
+        key = self._view_key()
+        if key == self._stack_trace_key:
+            self._send_response(req, True, self._stack_trace_body)
+            return
+
         if self.tm._next_instruction:
             line = self.tm._next_instruction.line_number
             name = f"State: {self.tm.state.name}"
@@ -280,9 +468,7 @@ class DAPServer:
             line = 0
             name = f"HALTED (State: {self.tm.state.name})"
 
-        self._send_response(
-            req,
-            True,
+        body = _json_dumps(
             {
                 "stackFrames": [
                     {
@@ -290,35 +476,26 @@ class DAPServer:
                         "name": name,
                         "line": line,
                         "column": 1,
-                        "source": {
-                            "name": os.path.basename(self.original_source_path),
-                            "path": self.original_source_path,
-                            "sourceReference": 0,
-                        },
+                        "source": self._source_dict,
                         "presentationHint": "normal",
                     }
                 ],
                 "totalFrames": 1,
-            },
+            }
         )
+        self._stack_trace_key, self._stack_trace_body = key, body
+        self._send_response(req, True, body)
 
     def handle_scopes(self, req):
-        # Unified scope "Machine State"
-        self._send_response(
-            req,
-            True,
-            {
-                "scopes": [
-                    {
-                        "name": "Machine State",
-                        "variablesReference": 1,
-                        "expensive": False,
-                    }
-                ]
-            },
-        )
+        self._send_response(req, True, self._SCOPES_BODY)
 
     def handle_variables(self, req):
+        # Same as stackTrace: the tape views only change when the machine steps
+        key = self._view_key()
+        if key == self._variables_key:
+            self._send_response(req, True, self._variables_body)
+            return
+
         vars_list = []
 
         # Machine Metrics
@@ -339,7 +516,7 @@ class DAPServer:
             }
         )
 
-        total_space = sum(h.space_complexity() for h in self.tm.heads)
+        total_space = self._total_space()
         vars_list.append(
             {
                 "name": "Space used",
@@ -350,18 +527,15 @@ class DAPServer:
         )
 
         # Tape Visualizations
+        blank = BLANK
         for i, head in enumerate(self.tm.heads):
             center = head.index
-            raw_dict = head.tape._tape
-
             # Using .get() for non-mutating access
-            left_ctx = "".join(
-                raw_dict.get(x, BLANK) for x in range(center - 5, center)
-            )
-            curr_val = raw_dict.get(center, BLANK)
-            right_ctx = "".join(
-                raw_dict.get(x, BLANK) for x in range(center + 1, center + 6)
-            )
+            get = head.tape._tape.get
+
+            left_ctx = "".join([get(center + o, blank) for o in self._LEFT_OFFSETS])
+            curr_val = get(center, blank)
+            right_ctx = "".join([get(center + o, blank) for o in self._RIGHT_OFFSETS])
 
             tape_display = f"{left_ctx}[{curr_val}]{right_ctx}"
 
@@ -374,7 +548,9 @@ class DAPServer:
                 }
             )
 
-        self._send_response(req, True, {"variables": vars_list})
+        body = _json_dumps({"variables": vars_list})
+        self._variables_key, self._variables_body = key, body
+        self._send_response(req, True, body)
 
     def handle_next(self, req):
         self.step_granularity = "step"
@@ -400,8 +576,4 @@ class DAPServer:
         sys.exit(0)
 
     def handle_exceptionInfo(self, req):
-        self._send_response(req, True, {
-            "exceptionId": "runtime_error",
-            "description": "An error occurred during execution",
-            "breakMode": "always"
-        })
\ No newline at end of file
+        self._send_response(req, True, self._EXCEPTION_INFO_BODY)
\ No newline at end of file